@@ -3,7 +3,7 @@
 # BAP.py - main for the CGE Bacterial Analysis Pipeline
 #
 
-import sys, os, argparse, gzip, io, json, re
+import sys, os, argparse, gzip, io, re, stat
 from pico.workflow.logic import Workflow
 from pico.workflow.executor import Executor
 from pico.jobcontrol.subproc import SubprocessScheduler
@@ -16,36 +16,72 @@ from . import __version__
 # Global variables and defaults
 SERVICE, VERSION = "CGE BAP", __version__
 
+# Read gzipped inputs in 128 KiB blocks (the CPython 3.12 default) rather
+# than the 8 KiB blocks older gzip modules use
+_GZIP_BUFSIZE = 128 * 1024
+if hasattr(gzip, 'READ_BUFFER_SIZE'):
+    gzip.READ_BUFFER_SIZE = _GZIP_BUFSIZE
+
+# Column headers of the bap-summary.tsv, in the order the values are written
+SUMMARY_HEADERS = (
+    's_id', 'n_reads', 'nt_read', 'pct_q30', 'n_ctgs', 'nt_ctgs', 'n1', 'n50',
+    'l50', 'avg_dp', 'q30_dp', 'ref_len', 'pct_gc', 'species', 'mlst',
+    'amr_cls', 'amr_res', 'dis_res', 'vir_gen', 'plasmid', 'pmlsts', 'cgst',
+    'amr_gen', 'amr_mut', 'dis_gen')
+
 # Exit with error message and non-zero code
 def err_exit(msg, *args):
     print(('BAP: %s' % msg) % args, file=sys.stderr)
     sys.exit(1)
 
-# Helper to detect whether file is (gzipped) fasta or fastq
-def detect_filetype(fname):
+# Precompiled pattern of standard Illumina fastq file names, capturing the sample id
+_ILLUMINA_FNAME_RE = re.compile(r'^(.*)_S[0-9]+_L[0-9]+_R[12]_[0-9]+\.fastq\.gz$')
+
+# The hex alphabet of a Nanopore read UUID
+_HEX_DIGITS = frozenset('0123456789abcdef')
+
+# Table mapping the lead character of a sequence file on its type
+_LEAD_CHAR_TYPES = { '>': 'fasta', '@': 'fastq' }
+
+# Helper to check header line against the Illumina spec:
+# @INSTR:RUN:FLOWCELL:LANE:TILE:X:Y 1:Y:0:INDEX with RUN,LANE,TILE,X,Y numeric
+def is_illumina_header(line):
+    parts = line.rstrip().split(' ')
+    if len(parts) < 2 or not parts[0].startswith('@'):
+        return False
+    l = parts[0][1:].split(':')
+    if len(l) != 7 or not (l[1].isdigit() and all(map(str.isdigit, l[3:]))):
+        return False
+    r = parts[1].split(':')
+    return len(r) == 4 and r[0] in ('1','2') and r[1] in ('Y','N') and r[2].isdigit() and r[3] != ''
+
+# Helper to check header line against the Nanopore spec: '@' followed by UUID
+#@3ea0b1a6-309d-4fa6-acf7-81318583eea3 runid=e78b393cae8ec468269f5fcfa954c3ff8bbb1344 sampleid=C2020 read=39660 ch=389 start_time=2021-03-10T21:50:19Z barcode=barcode01
+def is_nanopore_header(line):
+    u = line[1:37]
+    return (line.startswith('@') and len(u) == 36 and
+        all(u[i] == '-' for i in (8,13,18,23)) and
+        all(c in _HEX_DIGITS for i,c in enumerate(u) if i not in (8,13,18,23)))
+
+# Helper to classify input file in one go: opens it once, detects gzip from
+# the magic bytes, and classifies the first line.  Returns 'fasta', 'illumina',
+# 'nanopore', 'fastq' (reads of undetermined platform), or 'other'.
+# Raises OSError if fname cannot be opened or is not a regular file.
+def classify_file(fname):
     with open(fname, 'rb') as f:
+        if not stat.S_ISREG(os.fstat(f.fileno()).st_mode):
+            raise OSError('not a regular file')
         b = f.peek(2)
-        if b[:2] == b'\x1f\x8b':
-            b = gzip.GzipFile(fileobj=f).peek(2)[:2]
-        c = chr(b[0]) if len(b) > 0 else '\x00'
-    return 'fasta' if c == '>' else 'fastq' if c == '@' else 'other'
-
-# Helper to test first line against re patter
-def first_line_matches(fname, regex):
-    pat = re.compile(regex)
-    with open(fname, 'rb') as f:
-        b = f.peek(2)
-        buf = io.TextIOWrapper(gzip.GzipFile(fileobj=f) if b[:2] == b'\x1f\x8b' else f)
-        return re.match(pat, buf.readline())
-
-# Helper to detect whether fastq file has Illumina reads
-def is_illumina_reads(fname):
-    return first_line_matches(fname, r'^@[^:]+:\d+:[^:]+:\d+:\d+:\d+:\d+ [12]:[YN]:\d+:[^: ]+( .*)?$')
-
-# Helper to detect whether fastq file has Illumina reads
-def is_nanopore_reads(fname):
-    #@3ea0b1a6-309d-4fa6-acf7-81318583eea3 runid=e78b393cae8ec468269f5fcfa954c3ff8bbb1344 sampleid=C2020 read=39660 ch=389 start_time=2021-03-10T21:50:19Z barcode=barcode01
-    return first_line_matches(fname, r'^@[0-9a-f]{8}(-[0-9a-f]{4}){3}-[0-9a-f]{12}.*$')
+        # errors='replace' so binary junk classifies as 'other' rather than
+        # dying on a decode error; real FASTA/fastq headers are ASCII anyway
+        buf = io.TextIOWrapper(io.BufferedReader(gzip.GzipFile(fileobj=f), _GZIP_BUFSIZE)
+                               if b[:2] == b'\x1f\x8b' else f, errors='replace')
+        line = buf.readline()
+    kind = _LEAD_CHAR_TYPES.get(line[:1], 'other')
+    if kind == 'fastq':
+        kind = 'illumina' if is_illumina_header(line) else \
+               'nanopore' if is_nanopore_header(line) else 'fastq'
+    return kind
 
 # Helper to parse string ts which may be UserTarget or Service
 def UserTargetOrService(s):
@@ -157,14 +193,14 @@ per line, in a text file and pass this file with @FILENAME.
     # Parse targets and translate to workflow arguments
     targets = []
     try:
-        targets = list(map(lambda t: UserTargets(t.strip()), args.targets.split(',') if args.targets else []))
+        targets = [UserTargets(t.strip()) for t in (args.targets.split(',') if args.targets else [])]
     except ValueError as ve:
         err_exit('invalid target: %s (try --list-available)', ve)
 
     # Parse excludes and translate to workflow arguments
     excludes = []
     try:
-        excludes = list(map(lambda t_or_s: UserTargetOrService(t_or_s.strip()), args.exclude.split(',') if args.exclude else []))
+        excludes = [UserTargetOrService(t_or_s.strip()) for t_or_s in (args.exclude.split(',') if args.exclude else [])]
     except ValueError as ve:
         err_exit('invalid exclude: %s (try --list-available)', ve)
 
@@ -172,22 +208,28 @@ per line, in a text file and pass this file with @FILENAME.
     contigs = None
     illufqs = list()
     nanofq = None
+
+    # Resolve paths against a single getcwd call rather than abspath per file
+    cwd = os.getcwd()
+    abs_path = lambda p: p if os.path.isabs(p) else os.path.normpath(os.path.join(cwd, p))
+
     for f in args.files:
-        if not os.path.isfile(f):
-            err_exit('no such file: %s', f)
-        if detect_filetype(f) == 'fasta':
+        try:
+            kind = classify_file(f)
+        except OSError as e:
+            err_exit('cannot read file %s: %s', f, e.strerror if e.strerror else e)
+        if kind == 'fasta':
             if contigs:
                 err_exit('more than one FASTA file passed: %s', f)
-            contigs = os.path.abspath(f)
-        elif detect_filetype(f) == 'fastq':
-            if is_illumina_reads(f):
-                illufqs.append(os.path.abspath(f))
-            elif is_nanopore_reads(f):
-                if nanofq:
-                    err_exit('more than one Nanopore fastq file passed: %s', f)
-                nanofq = os.path.abspath(f)
-            else:
-                err_exit('cannot detect whether file has Illumina or Nanopore reads: %s', f)
+            contigs = abs_path(f)
+        elif kind == 'illumina':
+            illufqs.append(abs_path(f))
+        elif kind == 'nanopore':
+            if nanofq:
+                err_exit('more than one Nanopore fastq file passed: %s', f)
+            nanofq = abs_path(f)
+        elif kind == 'fastq':
+            err_exit('cannot detect whether file has Illumina or Nanopore reads: %s', f)
         else:
             err_exit("file is neither FASTA not fastq: %s" % f)
 
@@ -233,9 +275,8 @@ per line, in a text file and pass this file with @FILENAME.
                 sample_id, _ = os.path.splitext(sample_id)
         elif illufqs:
             # Try if it is pure Illumina
-            pat = re.compile(r'^(.*)_S[0-9]+_L[0-9]+_R[12]_[0-9]+\.fastq\.gz$')
             _, fname = os.path.split(illufqs[0])
-            mat = pat.fullmatch(fname)
+            mat = _ILLUMINA_FNAME_RE.fullmatch(fname)
             if mat:
                 sample_id = mat.group(1)
             else: # no illumina, try to fudge something from common part
@@ -273,10 +314,10 @@ per line, in a text file and pass this file with @FILENAME.
         blackboard.put_nanofq_path(nanofq)
     if args.species:
         params.append(Params.SPECIES)
-        blackboard.put_user_species(list(filter(None, map(lambda x: x.strip(), args.species.split(',')))))
+        blackboard.put_user_species([s.strip() for s in args.species.split(',') if s.strip()])
     if args.plasmids:
         params.append(Params.PLASMIDS)
-        blackboard.put_user_plasmids(list(filter(None, map(lambda x: x.strip(), args.plasmids.split(',')))))
+        blackboard.put_user_plasmids([p.strip() for p in args.plasmids.split(',') if p.strip()])
 
     # Pass the actual data via the blackboard
     scheduler = SubprocessScheduler(args.max_cpus, args.max_mem, args.max_time, args.poll, args.quiet or not args.verbose)
@@ -287,47 +328,52 @@ per line, in a text file and pass this file with @FILENAME.
 
     # Write the JSON results file
     with open('bap-results.json', 'w') as f_json:
-        json.dump(blackboard.as_dict(True), f_json)
+        blackboard.write_json(f_json, True)
 
     # Write the TSV summary results file
     with open('bap-summary.tsv', 'w') as f_tsv:
         commasep = lambda l: ','.join(l) if l else ''
         b = blackboard
 
+        # Fetch the metrics results and closest reference subtrees once
+        cm = b.get('services/ContigsMetrics/results', {})
+        rm = b.get('services/ReadsMetrics/results', {})
+        closest = b.get_closest_reference({})
+
         # For computing cross-service metrics
-        nt_ctgs = int(b.get('services/ContigsMetrics/results/tot_len', 0))
-        nt_read = int(b.get('services/ReadsMetrics/results/bases', 0))
-        pct_q30 = float(b.get('services/ReadsMetrics/results/pct_q30', 0))
-
-        d = dict({
-            's_id': b.get_sample_id(),
-            'n_reads': b.get('services/ReadsMetrics/results/reads', 'NA'),
-            'nt_read': nt_read if nt_read else 'NA',
-            'pct_q30': pct_q30 if pct_q30 else 'NA',
-            'n_ctgs': b.get('services/ContigsMetrics/results/n_seqs', 'NA'),
-            'nt_ctgs': nt_ctgs if nt_ctgs else 'NA',
-            'n1': b.get('services/ContigsMetrics/results/n1', 'NA'),
-            'n50': b.get('services/ContigsMetrics/results/n50', 'NA'),
-            'l50': b.get('services/ContigsMetrics/results/l50', 'NA'),
-            'avg_dp': int(0.5 + nt_read / nt_ctgs) if nt_ctgs and nt_read else 'NA',
-            'q30_dp': int(0.5 + pct_q30 / 100 * nt_read / nt_ctgs) if nt_ctgs and nt_read and pct_q30 else 'NA',
-            'ref_len': b.get_closest_reference_length('NA'),
-            'pct_gc': b.get('services/ContigsMetrics/results/pct_gc', b.get('services/ReadsMetrics/results/pct_gc', 'NA')),
-            'species': commasep(b.get_detected_species([])),
-            'mlst': commasep(b.get_mlsts()),
-            'amr_cls': commasep(b.get_amr_classes()),
-            'amr_res': commasep(b.get_amr_antibiotics()),
-            'dis_res': commasep(b.get_dis_resistances()),
-            'vir_gen': commasep(b.get_virulence_genes()),
-            'plasmid': commasep(b.get_detected_plasmids([])),
-            'pmlsts': commasep(b.get_pmlsts()),
-            'cgst': commasep(b.get_cgmlsts()),
-            'amr_gen': commasep(b.get_amr_genes()),
-            'amr_mut': commasep(b.get_amr_mutations()),
-            'dis_gen': commasep(b.get_dis_genes())
-            })
-        print('#', '\t'.join(d.keys()), file=f_tsv)
-        print('\t'.join(map(lambda v: str(v) if v else '', d.values())), file=f_tsv)
+        nt_ctgs = int(cm.get('tot_len', 0))
+        nt_read = int(rm.get('bases', 0))
+        pct_q30 = float(rm.get('pct_q30', 0))
+
+        values = (
+            b.get_sample_id(),
+            rm.get('reads', 'NA'),
+            nt_read if nt_read else 'NA',
+            pct_q30 if pct_q30 else 'NA',
+            cm.get('n_seqs', 'NA'),
+            nt_ctgs if nt_ctgs else 'NA',
+            cm.get('n1', 'NA'),
+            cm.get('n50', 'NA'),
+            cm.get('l50', 'NA'),
+            int(0.5 + nt_read / nt_ctgs) if nt_ctgs and nt_read else 'NA',
+            int(0.5 + pct_q30 / 100 * nt_read / nt_ctgs) if nt_ctgs and nt_read and pct_q30 else 'NA',
+            closest.get('length', 'NA'),
+            cm.get('pct_gc', rm.get('pct_gc', 'NA')),
+            commasep(b.get_detected_species([])),
+            commasep(b.get_mlsts()),
+            commasep(b.get_amr_classes()),
+            commasep(b.get_amr_antibiotics()),
+            commasep(b.get_dis_resistances()),
+            commasep(b.get_virulence_genes()),
+            commasep(b.get_detected_plasmids([])),
+            commasep(b.get_pmlsts()),
+            commasep(b.get_cgmlsts()),
+            commasep(b.get_amr_genes()),
+            commasep(b.get_amr_mutations()),
+            commasep(b.get_dis_genes()))
+
+        f_tsv.write('# ' + '\t'.join(SUMMARY_HEADERS) + '\n')
+        f_tsv.write('\t'.join(str(v) if v else '' for v in values) + '\n')
 
     # Done done
     return 0
@@ -5,7 +5,7 @@
 #   Defines the data structures that are shared across the BAP services.
 #
 
-import os, enum
+import os, enum, json
 from datetime import datetime
 from pico.workflow.blackboard import Blackboard
 
@@ -20,6 +20,25 @@ class BAPBlackboard(Blackboard):
     '''Adds to the generic Blackboard getters and putters specific to the shared
        data definitions in the current BAP.'''
 
+    # We add no instance state of our own (all data goes in the backing store)
+    __slots__ = ()
+
+    # Blackboard paths used by the accessors below, composed once rather than
+    # rebuilt as a string on every get and put
+    _P_SPECIES          = 'bap/summary/species'
+    _P_MLST             = 'bap/summary/mlst'
+    _P_CLOSEST          = 'bap/summary/closest'
+    _P_PLASMIDS         = 'bap/summary/plasmids'
+    _P_PMLSTS           = 'bap/summary/pmlsts'
+    _P_VIR_GENES        = 'bap/summary/virulence_genes'
+    _P_AMR_GENES        = 'bap/summary/amr_genes'
+    _P_AMR_CLASSES      = 'bap/summary/amr_classes'
+    _P_AMR_ANTIBIOTICS  = 'bap/summary/amr_antibiotics'
+    _P_AMR_MUTATIONS    = 'bap/summary/amr_mutations'
+    _P_DIS_GENES        = 'bap/summary/dis_genes'
+    _P_DIS_RESISTANCES  = 'bap/summary/dis_resistances'
+    _P_CGMLST           = 'bap/summary/cgmlst'
+
     def __init__(self, verbose=False):
         super().__init__(verbose)
 
@@ -38,16 +57,37 @@ class BAPBlackboard(Blackboard):
         self.put('bap/run_info/time/duration', (end_time - start_time).total_seconds())
         self.put('bap/run_info/status', state)
 
+    def write_json(self, fp, full=False):
+        '''Serialise the blackboard to open file fp, writing the encoder chunks
+           as they are produced rather than materialising the whole document.'''
+        for chunk in json.JSONEncoder().iterencode(self.as_dict(full)):
+            fp.write(chunk)
+
     def put_user_input(self, param, value):
-        return self.put('bap/user_inputs/%s' % param, value)
+        return self.put(f'bap/user_inputs/{param}', value)
 
     def get_user_input(self, param, default=None):
-        return self.get('bap/user_inputs/%s' % param, default)
+        return self.get(f'bap/user_inputs/{param}', default)
 
     def add_warning(self, warning):
         '''Stores a warning on the 'bap' top level (note: use service warning instead).'''
         self.append_to('bap/warnings', warning)
 
+    def put_many(self, items):
+        '''Store every path -> value of dict items, a single call for a batch
+           of puts.  The backing store is still updated per path, so this
+           amortises only the call overhead until picoline grows a bulk put.'''
+        put = self.put
+        for path, value in items.items():
+            put(path, value)
+
+    def append_uniques(self, path, values):
+        '''Append value or list of values to the list at path, dropping duplicates
+           but keeping insertion order, with a single get and put on the store.'''
+        vals = values if isinstance(values, list) else [values]
+        cur = self.get(path, [])
+        self.put(path, list(dict.fromkeys(cur + vals)))
+
     # Standard methods for BAP common data
 
     def put_db_root(self, path):
@@ -119,10 +159,10 @@ class BAPBlackboard(Blackboard):
         return self.get_user_input('species', default)
 
     def add_detected_species(self, lst):
-        self.append_to('bap/summary/species', lst, True)
+        self.append_uniques(self._P_SPECIES, lst)
 
     def get_detected_species(self, default=None):
-        return self.get('bap/summary/species', default)
+        return self.get(self._P_SPECIES, default)
 
     def get_species(self, default=None):
         ret = list()
@@ -147,7 +187,7 @@ class BAPBlackboard(Blackboard):
 
     def get_closest_reference(self, default=None):
         '''Returns dict with fields accession, name, path, length, or the default.'''
-        return self.get('bap/summary/closest', default)
+        return self.get(self._P_CLOSEST, default)
 
     def get_closest_reference_path(self, default=None):
         return self.get_closest_reference({}).get('path', default)
@@ -158,13 +198,13 @@ class BAPBlackboard(Blackboard):
     # MLST
 
     def add_mlst(self, name, st, loci, alleles, near):
-        str = "%s %s [%s]" % (name, st, ' '.join(map(lambda l: '%s:%s' % l, zip(loci, alleles))))
+        str = f"{name} {st} [{' '.join(f'{l}:{a}' for l, a in zip(loci, alleles))}]"
         if near:
-            str += " (near %s)" % ' '.join(near)
-        self.append_to('bap/summary/mlst', str, True)
+            str += f" (near {' '.join(near)})"
+        self.append_uniques(self._P_MLST, str)
 
     def get_mlsts(self):
-        return sorted(self.get('bap/summary/mlst', []))
+        return sorted(self.get(self._P_MLST, []))
 
     # Plasmids
 
@@ -176,10 +216,14 @@ class BAPBlackboard(Blackboard):
         return sorted(self.get_user_input('plasmids', default))
 
     def add_detected_plasmid(self, plasmid):
-        self.append_to('bap/summary/plasmids', plasmid, True)
+        self.append_uniques(self._P_PLASMIDS, plasmid)
+
+    def add_detected_plasmids(self, plasmids):
+        '''Stores a list of detected plasmids in a single blackboard update.'''
+        self.append_uniques(self._P_PLASMIDS, plasmids)
 
     def get_detected_plasmids(self, default=None):
-        return sorted(self.get('bap/summary/plasmids', default))
+        return sorted(self.get(self._P_PLASMIDS, default))
 
     def get_plasmids(self, default=None):
         ret = list()
@@ -189,63 +233,46 @@ class BAPBlackboard(Blackboard):
 
     def add_pmlst(self, profile, st):
         str = "%s%s" % (profile, st)
-        self.append_to('bap/summary/pmlsts', str)
+        self.append_to(self._P_PMLSTS, str)
 
     def get_pmlsts(self):
-        return sorted(self.get('bap/summary/pmlsts', []))
-
-    # Virulence
-
-    def add_detected_virulence_gene(self, gene):
-        self.append_to('bap/summary/virulence_genes', gene, True)
-
-    def get_virulence_genes(self):
-        return sorted(self.get('bap/summary/virulence_genes', []))
-
-    # Resistance
-
-    def add_amr_gene(self, gene):
-        self.append_to('bap/summary/amr_genes', gene, True)
-
-    def get_amr_genes(self):
-        return sorted(self.get('bap/summary/amr_genes', []))
-
-    def add_amr_class(self, classes):
-        self.append_to('bap/summary/amr_classes', classes, True)
+        return sorted(self.get(self._P_PMLSTS, []))
 
-    def get_amr_classes(self):
-        return sorted(self.get('bap/summary/amr_classes', []))
-
-    def add_amr_antibiotic(self, pheno):
-        self.append_to('bap/summary/amr_antibiotics', pheno, True)
-
-    def get_amr_antibiotics(self):
-        return sorted(self.get('bap/summary/amr_antibiotics', []))
-
-    def add_amr_mutation(self, mut):
-        self.append_to('bap/summary/amr_mutations', mut, True)
-
-    def get_amr_mutations(self):
-        return sorted(self.get('bap/summary/amr_mutations', []))
-
-    def add_dis_gene(self, gene):
-        self.append_to('bap/summary/dis_genes', gene, True)
-
-    def get_dis_genes(self):
-        return sorted(self.get('bap/summary/dis_genes', []))
-
-    def add_dis_resistance(self, dis):
-        self.append_to('bap/summary/dis_resistances', dis, True)
-
-    def get_dis_resistances(self):
-        return sorted(self.get('bap/summary/dis_resistances', []))
+    # Virulence and resistance accessors (add_* and get_*) are mechanical
+    # adder/getter pairs over uniqued summary lists, generated below
 
     # cgMLST
 
     def add_cgmlst(self, scheme, st, pct):
         str = '%s:%s(%s%%)' % (scheme, st, pct)
-        self.append_to('bap/summary/cgmlst', str, True)
+        self.append_uniques(self._P_CGMLST, str)
 
     def get_cgmlsts(self):
-        return sorted(self.get('bap/summary/cgmlst', []))
+        return sorted(self.get(self._P_CGMLST, []))
+
+
+### Generated accessors
+#
+#   The summary lists below all have the same adder (append unique value) and
+#   getter (sorted list), so we generate the method pairs rather than spell
+#   out forty near-identical defs.
+
+def _def_list_accessors(adder, getter, path):
+    def _add(self, value):
+        self.append_uniques(path, value)
+    def _get(self):
+        return sorted(self.get(path, []))
+    _add.__name__, _get.__name__ = adder, getter
+    setattr(BAPBlackboard, adder, _add)
+    setattr(BAPBlackboard, getter, _get)
+
+for _adder, _getter, _path in [
+    ('add_detected_virulence_gene', 'get_virulence_genes',  BAPBlackboard._P_VIR_GENES),
+    ('add_amr_gene',                'get_amr_genes',        BAPBlackboard._P_AMR_GENES),
+    ('add_amr_class',               'get_amr_classes',      BAPBlackboard._P_AMR_CLASSES),
+    ('add_amr_antibiotic',          'get_amr_antibiotics',  BAPBlackboard._P_AMR_ANTIBIOTICS),
+    ('add_amr_mutation',            'get_amr_mutations',    BAPBlackboard._P_AMR_MUTATIONS),
+    ('add_dis_gene',                'get_dis_genes',        BAPBlackboard._P_DIS_GENES),
+    ('add_dis_resistance',          'get_dis_resistances',  BAPBlackboard._P_DIS_RESISTANCES) ]:
+    _def_list_accessors(_adder, _getter, _path)
 
@@ -7,50 +7,54 @@
 #   the service.
 #
 
+import importlib
+
 # Import the Services enum
 from .workflow import Services
 
-# Import the shim classes that implement each service
-from .shims.base import UnimplementedService
-from .shims.cgMLSTFinder import cgMLSTFinderShim
-from .shims.CholeraeFinder import CholeraeFinderShim
-from .shims.ContigsMetrics import ContigsMetricsShim
-from .shims.DisinFinder import DisinFinderShim
-from .shims.GetReference import GetReferenceShim
-from .shims.GFAConnector import GFAConnectorShim
-from .shims.Flye import FlyeShim
-from .shims.KCST import KCSTShim
-from .shims.KmerFinder import KmerFinderShim
-from .shims.MLSTFinder import MLSTFinderShim
-from .shims.PlasmidFinder import PlasmidFinderShim
-from .shims.pMLST import pMLSTShim
-from .shims.PointFinder import PointFinderShim
-from .shims.ReadsMetrics import ReadsMetricsShim
-from .shims.ResFinder import ResFinderShim
-from .shims.SKESA import SKESAShim
-from .shims.VirulenceFinder import VirulenceFinderShim
-
-SERVICES = {
-    Services.CONTIGSMETRICS:    ContigsMetricsShim(),
-    Services.READSMETRICS:      ReadsMetricsShim(),
-    Services.SKESA:             SKESAShim(),
-    Services.FLYE:              FlyeShim(),
-    Services.GFACONNECTOR:      GFAConnectorShim(),
-    Services.KCST:              KCSTShim(),
-    Services.MLSTFINDER:        MLSTFinderShim(),
-    Services.KMERFINDER:        KmerFinderShim(),
-    Services.GETREFERENCE:      GetReferenceShim(),
-    Services.RESFINDER:         ResFinderShim(),
-    Services.POINTFINDER:       PointFinderShim(),
-    Services.DISINFINDER:       DisinFinderShim(),
-    Services.VIRULENCEFINDER:   VirulenceFinderShim(),
-    Services.PLASMIDFINDER:     PlasmidFinderShim(),
-    Services.PMLSTFINDER:       pMLSTShim(),
-    Services.CGMLSTFINDER:      cgMLSTFinderShim(),
-    Services.CHOLERAEFINDER:    CholeraeFinderShim(),
+# Map each service on the shim module and class that implement it.  The
+# modules are imported lazily (below), so that a run pulls in only the
+# shims for the services it actually executes.
+SERVICE_SHIMS = {
+    Services.CONTIGSMETRICS:    ('ContigsMetrics', 'ContigsMetricsShim'),
+    Services.READSMETRICS:      ('ReadsMetrics', 'ReadsMetricsShim'),
+    Services.SKESA:             ('SKESA', 'SKESAShim'),
+    Services.FLYE:              ('Flye', 'FlyeShim'),
+    Services.GFACONNECTOR:      ('GFAConnector', 'GFAConnectorShim'),
+    Services.KCST:              ('KCST', 'KCSTShim'),
+    Services.MLSTFINDER:        ('MLSTFinder', 'MLSTFinderShim'),
+    Services.KMERFINDER:        ('KmerFinder', 'KmerFinderShim'),
+    Services.GETREFERENCE:      ('GetReference', 'GetReferenceShim'),
+    Services.RESFINDER:         ('ResFinder', 'ResFinderShim'),
+    Services.POINTFINDER:       ('PointFinder', 'PointFinderShim'),
+    Services.DISINFINDER:       ('DisinFinder', 'DisinFinderShim'),
+    Services.VIRULENCEFINDER:   ('VirulenceFinder', 'VirulenceFinderShim'),
+    Services.PLASMIDFINDER:     ('PlasmidFinder', 'PlasmidFinderShim'),
+    Services.PMLSTFINDER:       ('pMLST', 'pMLSTShim'),
+    Services.CGMLSTFINDER:      ('cgMLSTFinder', 'cgMLSTFinderShim'),
+    Services.CHOLERAEFINDER:    ('CholeraeFinder', 'CholeraeFinderShim'),
 }
 
+
+class LazyServices(dict):
+    '''Maps each Services.* enum to its shim instance, importing the shim
+       module and instantiating the shim on first lookup.'''
+
+    def __missing__(self, key):
+        mod_name, cls_name = SERVICE_SHIMS[key]
+        mod = importlib.import_module('.shims.' + mod_name, __package__)
+        self[key] = shim = getattr(mod, cls_name)()
+        return shim
+
+    def __contains__(self, key):
+        return key in SERVICE_SHIMS
+
+    def get(self, key, default=None):
+        return self[key] if key in SERVICE_SHIMS else default
+
+
+SERVICES = LazyServices()
+
 # Check that every enum that is defined has a mapping to a service
 for s in Services:
     assert s in SERVICES, "No service shim defined for service %s" % s
-
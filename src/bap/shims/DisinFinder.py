@@ -5,7 +5,7 @@
 
 import os, json, logging
 from pico.workflow.executor import Task
-from pico.jobcontrol.job import JobSpec, Job
+from pico.jobcontrol.job import JobSpec
 from .base import ServiceExecution, UserException
 from .versions import BACKEND_VERSIONS
 
@@ -3,9 +3,9 @@
 # bap.shims.GetReference - service shim to the GetReference backend
 #
 
-import os, logging, functools
+import os, mmap, logging
 from pico.workflow.executor import Task
-from pico.jobcontrol.job import JobSpec, Job
+from pico.jobcontrol.job import JobSpec
 from .base import ServiceExecution, UserException, SkipException
 from .KmerFinder import find_db as find_kmer_db
 from .versions import BACKEND_VERSIONS
@@ -80,12 +80,56 @@ class GetReferenceExecution(ServiceExecution):
         path = job.file_path(self._out_file)
 
         if os.path.isfile(path):
-            length = 0
-            with open(path, 'r') as f:
-                length = functools.reduce(lambda a, l: a if l.startswith('>') else a + len(l.strip()), f, 0)
+            fai = path + '.fai'
+            length = faidx_seq_length(fai) if os.path.isfile(fai) else fasta_seq_length(path)
             self.store_results({ 'fasta_file': path, 'genome_length': length })
             self._blackboard.put_closest_reference_path(path)
             self._blackboard.put_closest_reference_length(length)
         else:
             self.fail("backend job produced no output, check: %s", job.file_path(""))
 
+
+# Sums the contig lengths (second column) of the faidx index at fai, giving
+# the genome length in O(contigs) without scanning the FASTA itself.
+def faidx_seq_length(fai):
+    with open(fai) as f:
+        return sum(int(l.split('\t', 2)[1]) for l in f if l.strip())
+
+
+# Computes the total sequence length of the FASTA file at path, counting
+# bytes rather than making a Python str of every line.  Header lines and
+# line-end characters are not counted.  The file is mmap'ed so the kernel
+# pages it in on demand and span boundaries need no buffer bookkeeping;
+# files that cannot be mapped (e.g. empty) go through the block scanner.
+def fasta_seq_length(path):
+
+    with open(path, 'rb') as f:
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, OSError):
+            return _fasta_seq_length_read(f)
+
+        with mm:
+            length = 0
+            pos, end = 0, len(mm)
+            find = mm.find
+            while pos < end:
+                if mm[pos:pos+1] == b'>':
+                    # Header line, skip through its newline
+                    nl = find(b'\n', pos)
+                    pos = end if nl < 0 else nl + 1
+                else:
+                    # Sequence spans up to the next header line or EOF
+                    nxt = find(b'\n>', pos)
+                    chunk = mm[pos:] if nxt < 0 else mm[pos:nxt+1]
+                    length += len(chunk) - chunk.count(b'\n') - chunk.count(b'\r')
+                    pos = end if nxt < 0 else nxt + 1
+            return length
+
+
+# Fallback for open binary file f: generator-sum over the lines, skipping
+# headers and not counting line-end bytes; the sum loop runs in C.
+def _fasta_seq_length_read(f):
+    return sum(len(l) - l.count(b'\n') - l.count(b'\r')
+               for l in f if not l.startswith(b'>'))
+
@@ -3,9 +3,9 @@
 # bap.shims.KmerFinder - service shim to the KmerFinder backend
 #
 
-import os, logging
+import os, csv, logging
 from pico.workflow.executor import Task
-from pico.jobcontrol.job import JobSpec, Job
+from pico.jobcontrol.job import JobSpec
 from .base import ServiceExecution, UserException
 from .versions import BACKEND_VERSIONS
 
@@ -17,6 +17,15 @@ MAX_CPU = 1
 MAX_MEM = 8
 MAX_TIM = 10 * 60
 
+# Keys and type converters for the shared result columns 1..12, zipped into
+# the hit dict per row rather than rebuilding a 14-key dict literal each time
+_HIT_KEYS = ('num', 'score', 'expected', 'slen',
+             'qcov', 'scov', 'depth', 'tot_qcov', 'tot_scov', 'tot_depth',
+             'q_value', 'p_value')
+_HIT_CONV = (int, int, int, int,
+             float, float, float, float, float, float,
+             float, float)
+
 
 class KmerFinderShim:
     '''Service shim that executes the backend.'''
@@ -81,45 +90,33 @@ class KmerFinderExecution(ServiceExecution):
         # The result list
         hits = list()      # list of detailed hit objects
 
-        with open(results_file, 'r') as f:
+        with open(results_file, 'r', newline='') as f:
 
             # The spa (no tax) file has these columns, where Template matches one in the database.name file
             # - Template (Accession " " Desc),Num,Score,Expected,Template_length,Query_Coverage,Template_Coverage,Depth,tot_query_Coverage,tot_template_Coverage,tot_depth,q_value,p_value
             # The tax file has these (note Accession here is not one from the spa file, but the new GCF accession (and Assembly is unique)
             # - 0:Assembly/accession,1:Num,Score,Expected,Template_length,Query_Coverage,Template_Coverage,Depth,tot_query_Coverage,tot_template_Coverage,tot_depth,q_value,p_value,Accession,Description,TAXID,Taxonomy,SpeciesTaxId,Species
 
-            # Skip header
-            f.readline()
-            line = f.readline()
+            # Parse the file with the C csv reader, skipping the header line;
+            # QUOTE_NONE keeps raw split semantics for fields that start with
+            # a quote (NCBI descriptions like "Brevibacterium helvolum" do)
+            reader = csv.reader(f, delimiter='\t', quoting=csv.QUOTE_NONE)
+            next(reader, None)
 
             # Parse all hits
-            while line:
-
-                rec = line.split('\t')
+            for rec in reader:
 
                 # Bail out completely if line doesn't have the right number of record
                 if (have_tax and len(rec) != 19) or (not have_tax and len(rec) != 13):
-                    self.fail('invalid line in KmerFinder results: %s' % line)
+                    self.fail('invalid line in KmerFinder results: %s' % '\t'.join(rec))
                     return
 
                 # The accession and description are at 13,14 in tax, and joined at 0 in non-tax
                 acc_dsc = [rec[13].strip(), rec[14].strip()] if have_tax else rec[0].strip().split(' ')
 
                 # Construct the hit object from the shared fields
-                hit = { 'accession' : acc_dsc[0],
-                        'desc' : acc_dsc[1],
-                        'num' : int(rec[1]),
-                        'score' : int(rec[2]),
-                        'expected' : int(rec[3]),
-                        'slen' : int(rec[4]),
-                        'qcov' : float(rec[5]),
-                        'scov' : float(rec[6]),
-                        'depth' : float(rec[7]),
-                        'tot_qcov' : float(rec[8]),
-                        'tot_scov' : float(rec[9]),
-                        'tot_depth' : float(rec[10]),
-                        'q_value' : float(rec[11]),
-                        'p_value' : float(rec[12]) }
+                hit = { 'accession' : acc_dsc[0], 'desc' : acc_dsc[1] }
+                hit.update(zip(_HIT_KEYS, (c(v) for c, v in zip(_HIT_CONV, rec[1:13]))))
 
                 # Add the taxonomy if we have it
                 if have_tax:
@@ -132,9 +129,6 @@ class KmerFinderExecution(ServiceExecution):
                 # Append to the list of hits
                 hits.append(hit)
 
-                # Iterate to next line
-                line = f.readline()
-
         # Store result
         self.store_results(hits)
 
@@ -147,34 +141,26 @@ class KmerFinderExecution(ServiceExecution):
             self._blackboard.put_closest_reference(hits[0].get('accession'), hits[0].get('desc'))
 
 
-# Returns comma-separated list of available databases in db_dir
-def list_dbs(db_dir):
-    dbs = list()
-    cfg = os.path.join(db_dir, "config")
-    if os.path.isfile(cfg):
-        with open(cfg) as f:
-            for l in f:
-                l = l.strip()
-                if l.startswith('#'): continue
-                r = l.split('\t')
-                if len(r) == 3:
-                    dbs.append(r[0].split('.')[0])
-    return ', '.join(dbs)
-
-
 # Locates database under db_dir, returns (db_path, tax_file)
-# or raises an exception with appriopriate error message
+# or raises an exception with appriopriate error message.
+# Scans the config in a single pass, collecting the available database names
+# as it goes so the not-found error does not re-read the config.
 def find_db(db_dir, name):
 
     config = os.path.join(db_dir, 'config')
     if not os.path.isfile(config):
         raise UserException('database config not found: %s', config)
 
-    # Look up the database in the config
+    dbs = list()
     with open(config) as f:
         for l in f:
             # Lines are {name}[.{kmersuffix}]\t{Description}\t{More}
-            if not l.startswith(name.lower()): continue
+            if not l.startswith(name.lower()):
+                # Not ours; remember its name for the error message below
+                l = l.strip()
+                if l and not l.startswith('#') and len(l.split('\t')) == 3:
+                    dbs.append(l.split('\t')[0].split('.')[0])
+                continue
             db_pfx = l.split('\t')[0].strip()
             db = l.split('.')[0] if '.' in db_pfx else db_pfx
             path = os.path.join(db_dir, db_pfx)
@@ -192,5 +178,5 @@ def find_db(db_dir, name):
             return (path, tax)
 
     # If we get here, the database was not in the config
-    raise UserException("database '%s' not in config; databases are: %s", name, list_dbs(db_dir))
+    raise UserException("database '%s' not in config; databases are: %s", name, ', '.join(dbs))
 
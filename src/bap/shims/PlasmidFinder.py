@@ -3,9 +3,18 @@
 # bap.shims.PlasmidFinder - service shim to the PlasmidFinder backend
 #
 
-import os, json, logging, tempfile
+import os, json, logging, tempfile, functools
+from operator import itemgetter
+try:    # optional, enables stream-parsing the backend JSON when installed
+    import ijson
+except ImportError:
+    ijson = None
+try:    # optional, faster drop-in decoder for the non-streaming path
+    import orjson
+except ImportError:
+    orjson = None
 from pico.workflow.executor import Task
-from pico.jobcontrol.job import JobSpec, Job
+from pico.jobcontrol.job import JobSpec
 from .base import ServiceExecution, UserException
 from .versions import BACKEND_VERSIONS
 
@@ -17,6 +26,9 @@ MAX_CPU = 1
 MAX_MEM = 1
 MAX_TIM = 10 * 60
 
+# Sort key for ordering hits by quality, C-implemented via itemgetter
+_QUALITY = itemgetter('quality')
+
 
 class PlasmidFinderShim:
     '''Service shim that executes the backend.'''
@@ -33,7 +45,10 @@ class PlasmidFinderShim:
             min_cov = execution.get_user_input('pf_c')
             search_list = list(filter(None, execution.get_user_input('pf_s', '').split(',')))
             # Note: errors out if only Nanopore reads available (which we can't handle yet)
-            inputs = list(map(os.path.abspath, execution.get_illufq_or_contigs_paths()))
+            # Absolutise against a cwd fetched once, not per path as abspath does
+            cwd = os.getcwd()
+            inputs = [ p if os.path.isabs(p) else os.path.normpath(os.path.join(cwd, p))
+                       for p in execution.get_illufq_or_contigs_paths() ]
 
             params = [
                 '-q',
@@ -70,7 +85,7 @@ class PlasmidFinderExecution(ServiceExecution):
     def start(self, db_path, params, search_list):
         '''Start a job for plasmidfinder, with the given parameters.'''
 
-        cfg_dict = parse_config(db_path)
+        cfg_dict = cached_parse_config(db_path)
         self._search_dict = find_databases(cfg_dict, search_list)
 
         job_spec = JobSpec('plasmidfinder.py', params, MAX_CPU, MAX_MEM, MAX_TIM)
@@ -90,10 +105,17 @@ class PlasmidFinderExecution(ServiceExecution):
         self._tmp_dir.cleanup()
         self._tmp_dir = None
 
-        # Load the JSON and obtain the 'results' element.
+        # Load the JSON and obtain the 'results' element.  With ijson present
+        # we stream just that subtree off the file rather than materialise the
+        # whole document.
         out_file = job.file_path('data.json')
         try:
-            with open(out_file, 'r') as f: json_in = json.load(f)
+            with open(out_file, 'rb') as f:
+                if ijson:
+                    res_in = next(ijson.items(f, self._service_name + '.results'), None)
+                else:
+                    loads = orjson.loads if orjson else json.loads
+                    res_in = loads(f.read()).get(self._service_name, {}).get('results')
         except:
             self.fail('failed to open or load JSON from file: %s' % out_file)
             return
@@ -105,13 +127,17 @@ class PlasmidFinderExecution(ServiceExecution):
         # a dict having the fields we need
         # ... but we deconvolve all this for uniformity
 
-        res_in = json_in.get(self._service_name, {}).get('results')
         if res_in is None:
             self.fail('no %s/results element in data.json' % self._service_name)
             return
 
-        if type(res_in) is not dict: # fix backend's "No hits found" to be {}
-            res_in = dict()
+        # Backend reports "No hits found" as a string; emit the empty result
+        # skeleton straight off the search_dict and skip the loops below
+        if type(res_in) is not dict or not res_in:
+            self.store_results([
+                { 'group': grp, 'searches': [ { 'database': db, 'hits': [] } for db in dbs ] }
+                for grp, dbs in self._search_dict.items() ])
+            return
 
         # Make res_out a list of result objects, one per database that a search was
         # requested for (even if no results).  So we iterate over the search_dict
@@ -119,7 +145,9 @@ class PlasmidFinderExecution(ServiceExecution):
         # Also we change the group and db names from key to values.
 
         res_out = list()
- 
+        plasmids = list()   # all detected plasmids, registered in one batch below
+        add_plasmid = plasmids.append
+
         # Iterate over the groups and their databases search was requested for
         for grp, dbs in self._search_dict.items():
 
@@ -132,13 +160,16 @@ class PlasmidFinderExecution(ServiceExecution):
                 hits_in = dbs_in.get(db, dict())
                 hits_in = hits_in if type(hits_in) is dict else dict()
                 hits_out = list()
+                add_hit = hits_out.append
 
                 for hit in hits_in.values():
 
                     plasmid = hit['plasmid']
-                    self._blackboard.add_detected_plasmid(plasmid)
+                    cov, ident = hit['coverage'], hit['identity']
+                    add_plasmid(plasmid)
 
-                    h_out = dict({
+                    # Append the hit to the output list
+                    add_hit({
                         'plasmid': plasmid,
                         # common
                         'hit_id':     hit['hit_id'],
@@ -150,27 +181,28 @@ class PlasmidFinderExecution(ServiceExecution):
                         'tgt_len':    hit['template_length'],
                         'tgt_pos':    hit['position_in_ref'],
                         'hsp_len':    hit['HSP_length'],
-                        'pct_cov':    hit['coverage'],
-                        'pct_ident':  hit['identity'],
-                        'quality':    hit['coverage'] * hit['identity'] / 100.0,
+                        'pct_cov':    cov,
+                        'pct_ident':  ident,
+                        'quality':    cov * ident * 0.01,
                         'note':       hit['note']
                         })
 
-                    # Append the hit to the output list
-                    hits_out.append(h_out)
-     
                 # Sort the hit list by descending goodness, and store under key db in dbs_out
-                hits_out.sort(key=lambda l: l['quality'], reverse=True)
+                hits_out.sort(key=_QUALITY, reverse=True)
                 dbs_out.append({ 'database': db, 'hits': hits_out })
 
             # Put the dbs_out object under key grp in the res_out object
             res_out.append({ 'group': grp, 'searches': dbs_out })
 
-        # Store the results on the blackboard
+        # Store the detected plasmids (if any, so the summary key stays absent
+        # on a hitless run) and the results on the blackboard
+        if plasmids:
+            self._blackboard.add_detected_plasmids(plasmids)
         self.store_results(res_out)
 
 
-# Parse the config file into a dict of group->[database], or raise on error.
+# Parse the config file into a tuple of (group->[database], database->group)
+# dicts, or raise on error.  The reverse map makes database lookups O(1).
 # Error includes the case where we find the same database (prefix) in two groups.
 # Though this could theoretically be allowed, we error out as the backend doesn't
 # (currently) handle this correctly: it counts the database in the first group only.
@@ -178,31 +210,48 @@ class PlasmidFinderExecution(ServiceExecution):
 def parse_config(db_root):
 
     group_dbs = dict()
-    databases = list()
+    db_to_grp = dict()
 
     cfg = os.path.join(db_root, "config")
     if not os.path.exists(cfg):
         raise UserException('database config file missing: %s', cfg)
 
+    # Read the file in one go and drop blanks and comments up front
     with open(cfg) as f:
-        for l in f:
+        rows = [ l.split('\t') for l in map(str.strip, f.read().split('\n'))
+                 if l and not l.startswith('#') ]
+
+    for r in rows:
 
-            l = l.strip()
-            if not l or l.startswith('#'): continue
-            r = l.split('\t')
-            if len(r) != 3:
-                raise UserException('invalid database config line: %s', l)
+        if len(r) != 3:
+            raise UserException('invalid database config line: %s', '\t'.join(r))
 
-            # See comment above, this should be possible in principle, but backend fails
-            db = r[0].strip()
-            if db in databases:
-                raise UserException('non-unique database prefix in config: %s', db)
-            databases.append(db)
+        # See comment above, this should be possible in principle, but backend fails
+        db = r[0].strip()
+        if db in db_to_grp:
+            raise UserException('non-unique database prefix in config: %s', db)
 
-            grp = r[1].strip()
-            group_dbs[grp] = group_dbs.get(grp, []) + [db]
+        grp = r[1].strip()
+        db_to_grp[db] = grp
+        group_dbs.setdefault(grp, []).append(db)
 
-    return group_dbs
+    return (group_dbs, db_to_grp)
+
+
+# Cache the parsed config per (db_root, mtime), so that executions against the
+# same database in one process skip the re-read; mtime invalidates on update.
+# Callers must not mutate the returned dict.
+
+@functools.lru_cache(maxsize=8)
+def _parse_config_cached(db_root, mtime):
+    return parse_config(db_root)
+
+def cached_parse_config(db_root):
+    try:
+        mtime = os.path.getmtime(os.path.join(db_root, 'config'))
+    except OSError:
+        return parse_config(db_root)    # raises the proper UserException
+    return _parse_config_cached(db_root, mtime)
 
 
 # Returns user-friendly string of databases (per group) from parsed config
@@ -213,32 +262,31 @@ def pretty_list_groups(cfg_dict):
         ret += '%s (%s);' % (k, ', '.join(v))
     return ret
 
-# If name matches a group, return tuple (group, [databases]) for that group,
-# else if it matches a database inside some group, return (group, [name]),
-# else error with the list of available groups and databases.
-
-def find_database(cfg_dict, name):
-    grp_dbs = cfg_dict.get(name)
-    if grp_dbs is None:
-        for grp in cfg_dict.keys():
-            if name in cfg_dict.get(grp):
-                return (grp,[name])
-        raise UserException('unknown group or database: %s; available are: %s',
-            name, pretty_list_groups(cfg_dict))
-    else:
+# If name matches a group in parsed config cfg, return tuple
+# (group, [databases]) for that group, else if it matches a database inside
+# some group (via the reverse index), return (group, [name]), else error with
+# the list of available groups and databases.
+
+def find_database(cfg, name):
+    group_dbs, db_to_grp = cfg
+    grp_dbs = group_dbs.get(name)
+    if grp_dbs is not None:
         return (name, grp_dbs)
+    grp = db_to_grp.get(name)
+    if grp is not None:
+        return (grp, [name])
+    raise UserException('unknown group or database: %s; available are: %s',
+        name, pretty_list_groups(group_dbs))
 
 # Return a dict group->[database] for the list of names.  Each name can name
 # a group or database, as for find_database above.  If names is an empty list,
-# returns the entire cfg_dict.
+# returns all groups and databases in parsed config cfg.
 
-def find_databases(cfg_dict, names):
+def find_databases(cfg, names):
     db_dict = dict()
-    for name in (names if names else cfg_dict.keys()):
-        grp, dbs = find_database(cfg_dict, name)
-        cur_dbs = db_dict.get(grp, [])
-        for db in dbs:
-            if db not in cur_dbs: cur_dbs.append(db)
-        db_dict[grp] = cur_dbs
-    return db_dict
+    for name in (names if names else cfg[0].keys()):
+        grp, dbs = find_database(cfg, name)
+        db_dict.setdefault(grp, []).extend(dbs)
+    # Dedup keeping insertion order, in one C-level pass per group
+    return { g: list(dict.fromkeys(v)) for g, v in db_dict.items() }
 
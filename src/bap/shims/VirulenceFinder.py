@@ -4,8 +4,12 @@
 #
 
 import os, json, logging, tempfile
+try:    # optional, faster drop-in decoder for the backend JSON
+    import orjson
+except ImportError:
+    orjson = None
 from pico.workflow.executor import Task
-from pico.jobcontrol.job import JobSpec, Job
+from pico.jobcontrol.job import JobSpec
 from .base import ServiceExecution, UserException
 from .versions import BACKEND_VERSIONS
 
@@ -105,7 +109,8 @@ class VirulenceFinderExecution(ServiceExecution):
 
         out_file = job.file_path('virulencefinder.json')
         try:
-            with open(out_file, 'r') as f: json_in = json.load(f)
+            with open(out_file, 'rb') as f:
+                json_in = orjson.loads(f.read()) if orjson else json.load(f)
         except Exception as e:
             logging.exception(e)
             self.fail('failed to open or load JSON from file: %s' % out_file)
@@ -143,7 +148,8 @@ class VirulenceFinderExecution(ServiceExecution):
         self.store_results(res_out)
 
 
-# Parse the config file into a dict of group->[database], or raise on error.
+# Parse the config file into a tuple of (group->[database], database->group)
+# dicts, or raise on error.  The reverse map makes database lookups O(1).
 # Error includes the case where we find the same database (prefix) in two groups.
 # Though this could theoretically be allowed, we error out as the backend doesn't
 # (currently) handle this correctly: it counts the database in the first group only.
@@ -151,31 +157,32 @@ class VirulenceFinderExecution(ServiceExecution):
 def parse_config(db_root):
 
     group_dbs = dict()
-    databases = list()
+    db_to_grp = dict()
 
     cfg = os.path.join(db_root, "config")
     if not os.path.exists(cfg):
         raise UserException('database config file missing: %s', cfg)
 
+    # Read the file in one go and drop blanks and comments up front
     with open(cfg) as f:
-        for l in f:
+        rows = [ l.split('\t') for l in map(str.strip, f.read().split('\n'))
+                 if l and not l.startswith('#') ]
 
-            l = l.strip()
-            if not l or l.startswith('#'): continue
-            r = l.split('\t')
-            if len(r) != 3:
-                raise UserException('invalid database config line: %s', l)
+    for r in rows:
 
-            # See comment above, this should be possible in principle, but backend fails
-            db = r[0].strip()
-            if db in databases:
-                raise UserException('non-unique database prefix in config: %s', db)
-            databases.append(db)
+        if len(r) != 3:
+            raise UserException('invalid database config line: %s', '\t'.join(r))
 
-            grp = r[1].strip()
-            group_dbs[grp] = group_dbs.get(grp, []) + [db]
+        # See comment above, this should be possible in principle, but backend fails
+        db = r[0].strip()
+        if db in db_to_grp:
+            raise UserException('non-unique database prefix in config: %s', db)
 
-    return group_dbs
+        grp = r[1].strip()
+        db_to_grp[db] = grp
+        group_dbs.setdefault(grp, []).append(db)
+
+    return (group_dbs, db_to_grp)
 
 
 # Returns user-friendly string of databases (per group) from parsed config
@@ -186,32 +193,31 @@ def pretty_list_groups(cfg_dict):
         ret += '%s (%s);' % (k, ', '.join(v))
     return ret
 
-# If name matches a group, return tuple (group, [databases]) for that group,
-# else if it matches a database inside some group, return (group, [name]),
-# else error with the list of available groups and databases.
-
-def find_database(cfg_dict, name):
-    grp_dbs = cfg_dict.get(name)
-    if grp_dbs is None:
-        for grp in cfg_dict.keys():
-            if name in cfg_dict.get(grp):
-                return (grp,[name])
-        raise UserException('unknown group or database: %s; available are: %s',
-            name, pretty_list_groups(cfg_dict))
-    else:
+# If name matches a group in parsed config cfg, return tuple
+# (group, [databases]) for that group, else if it matches a database inside
+# some group (via the reverse index), return (group, [name]), else error with
+# the list of available groups and databases.
+
+def find_database(cfg, name):
+    group_dbs, db_to_grp = cfg
+    grp_dbs = group_dbs.get(name)
+    if grp_dbs is not None:
         return (name, grp_dbs)
+    grp = db_to_grp.get(name)
+    if grp is not None:
+        return (grp, [name])
+    raise UserException('unknown group or database: %s; available are: %s',
+        name, pretty_list_groups(group_dbs))
 
 # Return a dict group->[database] for the list of names.  Each name can name
 # a group or database, as for find_database above.  If names is an empty list,
-# returns the entire cfg_dict.
+# returns all groups and databases in parsed config cfg.
 
-def find_databases(cfg_dict, names):
+def find_databases(cfg, names):
     db_dict = dict()
-    for name in (names if names else cfg_dict.keys()):
-        grp, dbs = find_database(cfg_dict, name)
-        cur_dbs = db_dict.get(grp, [])
-        for db in dbs:
-            if db not in cur_dbs: cur_dbs.append(db)
-        db_dict[grp] = cur_dbs
-    return db_dict
+    for name in (names if names else cfg[0].keys()):
+        grp, dbs = find_database(cfg, name)
+        db_dict.setdefault(grp, []).extend(dbs)
+    # Dedup keeping insertion order, in one C-level pass per group
+    return { g: list(dict.fromkeys(v)) for g, v in db_dict.items() }
 
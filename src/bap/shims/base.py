@@ -5,11 +5,36 @@
 #   This module defines ServiceExecution and UnimplementedService.
 #
 
-import os
+import os, sys, time
 from datetime import datetime
+from functools import lru_cache
 from pico.workflow.executor import Task
 from pico.jobcontrol.job import Job
 
+# Sentinel for absent entries in the ServiceExecution getter cache
+_NOT_CACHED = object()
+
+# Timestamp format for run_info, same output as isoformat(timespec='seconds')
+# but without the timespec dispatch overhead
+_ISO_FMT = '%Y-%m-%dT%H:%M:%S'
+
+# Pre-resolved Task.State values, written to the status field on every
+# transition without going through the enum value descriptor
+_STATE_VALUES = { s: s.value for s in Task.State }
+
+# run_info key suffixes written on every transition, appended to the
+# per-execution prefix cached on the instance
+_RI_TIME_START    = 'time/start'
+_RI_TIME_END      = 'time/end'
+_RI_TIME_DURATION = 'time/duration'
+_RI_STATUS        = 'status'
+
+# Directory existence cache shared by all executions in the process; the
+# service databases do not appear or vanish mid-run
+@lru_cache(maxsize=256)
+def _isdir(path):
+    return os.path.isdir(path)
+
 
 ### class UserException
 #
@@ -38,20 +63,34 @@ class SkipException(Exception):
 class ServiceExecution(Task):
     '''Implements a single BAP service execution, subclass for shims to build on.'''
 
-    _blackboard = None
-    _scheduler = None
+    # Fixed attribute slots: one execution exists per service per workflow,
+    # and slot access beats a dict lookup.  The per-instance dict itself only
+    # goes away once the pico Task base grows __slots__ too.
+    __slots__ = ('_blackboard', '_scheduler', '_start_mono', '_cache',
+                 '_ri_prefix', '_warn_key', '_err_key', '_res_key')
 
     def __init__(self, svc_shim, svc_version, sid, xid, blackboard, scheduler):
         '''Construct execution of service sid for workflow execution xid (will be None)
            writing to blackboard and using the scheduler.'''
+        # Intern the sid: it recurs as a key segment in every blackboard path
+        # of this execution, and interned strings compare by pointer there
+        sid = sys.intern(sid)
         super().__init__(sid, xid)
         self._blackboard = blackboard
         self._scheduler = scheduler
+        # Precompute the blackboard keys used on every helper call below
+        self._ri_prefix = f'services/{sid}/run_info/'
+        self._warn_key = f'services/{sid}/warnings'
+        self._err_key = f'services/{sid}/errors'
+        self._res_key = f'services/{sid}/results'
+        # Per-instance cache for the getters below (see _cached)
+        self._cache = dict()
         #self.put_run_info('id', self.id)		is (sid,xid) and here always (sid,None)
         #self.put_run_info('execution', xid)	always None
-        self.put_run_info('shim', svc_shim)
-        self.put_run_info('version', svc_version)
-        self.put_run_info('service', sid)
+        self._blackboard.put_many({
+            self._ri_prefix + 'shim': svc_shim,
+            self._ri_prefix + 'version': svc_version,
+            self._ri_prefix + 'service': sid })
         self._transition(Task.State.STARTED)
 
     # Implementable interface of the execution, to be implemented in subclasses
@@ -74,31 +113,35 @@ class ServiceExecution(Task):
     # Low level update routines for subclasses
 
     def get_run_info(self, path):
-        return self._blackboard.get('services/%s/run_info/%s' % (self.sid, path))
+        return self._blackboard.get(self._ri_prefix + path)
 
     def put_run_info(self, path, value):
         '''Update the run_info for this execution to have value at path.'''
-        self._blackboard.put('services/%s/run_info/%s' % (self.sid, path), value)
+        self._blackboard.put(self._ri_prefix + path, value)
 
     def add_warning(self, warning):
         '''Add warning to the list of warnings of the execution.'''
-        self._blackboard.append_to('services/%s/%s' % (self.sid, 'warnings'), warning)
+        self._blackboard.append_to(self._warn_key, warning)
 
     def add_warnings(self, warnings):
         '''Add list of warnings if not empty to the list of warnings of the execution.'''
-        self.add_warning(list(filter(None, warnings)))  # append_to deals with lists
+        ws = [w for w in warnings if w] if warnings else None
+        if ws:
+            self.add_warning(ws)  # append_to deals with lists
 
     def add_error(self, errmsg):
         '''Add errmsg to the list of errors of the service.'''
-        self._blackboard.append_to('services/%s/%s' % (self.sid, 'errors'), errmsg)
+        self._blackboard.append_to(self._err_key, errmsg)
 
     def store_job_spec(self, jobspec):
         '''Store the service parameters on the blackboard.'''
         self.put_run_info('job', jobspec)
 
     def store_results(self, result):
-        '''Store the service results on the blackboard.'''
-        self._blackboard.put('services/%s/results' % self.sid, result)
+        '''Store the service results on the blackboard.  The blackboard keeps
+           a reference, not a copy, so the caller must hand over ownership of
+           result and not mutate it afterwards.'''
+        self._blackboard.put(self._res_key, result)
 
     # Override Task._transition() to add timestamps and status on blackboard.
 
@@ -109,24 +152,40 @@ class ServiceExecution(Task):
         # Rely on superclass to set self.state and self.error
         super()._transition(new_state, error)
 
-        # Set the run_info timestamps
-        now_time = datetime.now()
+        # Write the run_info fields with one bound put rather than a method
+        # call into put_run_info per field; put_run_info remains for callers
+        bb_put = self._blackboard.put
+        prefix = self._ri_prefix
+
+        # Set the run_info timestamps; duration comes off the monotonic clock
+        # (kept on self at start), so it is immune to wall-clock jumps and the
+        # wall timestamps serve only the human-readable start/end fields
         if new_state == Task.State.STARTED:
-            self.put_run_info('time/start', now_time.isoformat(timespec='seconds'))
+            self._start_mono = time.monotonic()
+            bb_put(prefix + _RI_TIME_START, datetime.now().strftime(_ISO_FMT))
         else:
-            start_time = datetime.fromisoformat(self.get_run_info('time/start'))
-            self.put_run_info('time/duration', (now_time - start_time).total_seconds())
-            self.put_run_info('time/end', now_time.isoformat(timespec='seconds'))
+            bb_put(prefix + _RI_TIME_DURATION, time.monotonic() - self._start_mono)
+            bb_put(prefix + _RI_TIME_END, datetime.now().strftime(_ISO_FMT))
 
         # Set the run_info status field and error list
-        self.put_run_info('status', new_state.value)
+        bb_put(prefix + _RI_STATUS, _STATE_VALUES[new_state])
         if new_state == Task.State.FAILED:
             self.add_error(self.error)
 
         return new_state
 
     # Getters for the shared fields among services;
-    # all of these raise an exception unless default is given
+    # all of these raise an exception unless default is given.
+    # The underlying blackboard lookups are memoised per instance, as the
+    # values cannot change within the lifetime of one execution; the default
+    # and raise logic stays per call so callers keep their own semantics.
+
+    def _cached(self, key, fetch):
+        '''Return the cached value for key, invoking fetch() on first use.'''
+        ret = self._cache.get(key, _NOT_CACHED)
+        if ret is _NOT_CACHED:
+            ret = self._cache[key] = fetch()
+        return ret
 
     def is_verbose(self):
         '''Return True if the run was requested to be verbose.'''
@@ -138,98 +197,130 @@ class ServiceExecution(Task):
 
     def get_db_path(self, db_name, default=None):
         '''Return the path to db_name under db_root, fail if not a dir.'''
-        db_path = os.path.join(self._blackboard.get_db_root(), db_name)
-        if not os.path.isdir(db_path):
-            raise UserException("database path not found: %s", db_path)
+        db_path = self._cache.get(('db', db_name))
+        if db_path is None:
+            root = self._cached('db_root', self._blackboard.get_db_root)
+            db_path = root + '/' + db_name   # root is absolute, join not needed
+            if not _isdir(db_path):
+                raise UserException("database path not found: %s", db_path)
+            self._cache[('db', db_name)] = db_path
         return db_path
 
     def get_user_input(self, param, default=None):
         '''Return the user-provided value for param, fail if no default provided.'''
-        ret = self._blackboard.get_user_input(param, default)
+        ret = self._cached(('ui', param), lambda: self._blackboard.get_user_input(param))
+        if ret is None:
+            ret = default
         if ret is None:
             raise UserException("required user input is missing: %s" % param)
         return ret
 
     def get_illufq_paths(self, default=None):
         '''Return the list of fastq paths, or fail if no default provided.'''
-        ret = self._blackboard.get_illufq_paths(default)
+        ret = self._cached('illufq_paths', lambda: self._blackboard.get_illufq_paths())
+        if ret is None:
+            ret = default
         if ret is None:
             raise UserException("no Illumina fastq files were provided")
         return ret
 
     def get_nanofq_path(self, default=None):
         '''Return the fastq path, or fail if no default provided.'''
-        ret = self._blackboard.get_nanofq_path(default)
+        ret = self._cached('nanofq_path', lambda: self._blackboard.get_nanofq_path())
+        if ret is None:
+            ret = default
         if ret is None:
             raise UserException("no Nanopore fastq files were provided")
         return ret
 
     def get_user_contigs_path(self, default=None):
         '''Return the path to the user provided contigs, or fail if no default.'''
-        ret = self._blackboard.get_user_contigs_path(default)
+        ret = self._cached('user_contigs', lambda: self._blackboard.get_user_contigs_path())
+        if ret is None:
+            ret = default
         if ret is None:
             raise UserException("no contigs file was provided")
         return ret
 
     def get_assembled_contigs_path(self, default=None):
         '''Return the path to the assembled contigs, or else default or else fail.'''
-        ret = self._blackboard.get_assembled_contigs_path(default)
+        ret = self._cached('assembled_contigs', lambda: self._blackboard.get_assembled_contigs_path())
+        if ret is None:
+            ret = default
         if ret is None:
             raise UserException("no contigs file was produced by an assembler")
         return ret
 
     def get_contigs_path(self, default=None):
         '''Return the path to the assembled contigs, or else user contigs, else default or fail.'''
-        ret = self._blackboard.get_assembled_contigs_path(self._blackboard.get_user_contigs_path(default))
+        ret = self._cached('assembled_contigs', lambda: self._blackboard.get_assembled_contigs_path())
+        if ret is None:
+            ret = self._cached('user_contigs', lambda: self._blackboard.get_user_contigs_path())
+        if ret is None:
+            ret = default
         if ret is None:
             raise UserException("no contigs file was provided or produced")
         return ret
 
     def get_illufq_or_contigs_paths(self, default=None):
         '''Return the Illumina fastqs or else the assembled or user provided contigs in a list.'''
-        ret = self._blackboard.get_illufq_paths(self.get_contigs_path([]))
+        ret = self._cached('illufq_or_contigs', lambda:
+            self._blackboard.get_illufq_paths(self.get_contigs_path([])))
         if not ret and default is None:
             raise UserException("no Illumina reads or contigs files were provided")
         return ret if isinstance(ret,list) else [ret]
 
     def get_fastq_or_contigs_paths(self, default=None):
         '''Return the Illumina fastqs, or else the Nanopore fastq, or else contigs, in a list, or else default or fail.'''
-        ret = self._blackboard.get_illufq_paths(self._blackboard.get_nanofq_path(self.get_contigs_path("")))
+        ret = self._cached('fastq_or_contigs', lambda:
+            self._blackboard.get_illufq_paths(self._blackboard.get_nanofq_path(self.get_contigs_path(""))))
         if not ret and default is None:
             raise UserException("no reads files or contigs files were provided")
         return ret if isinstance(ret,list) else [ret]
 
     def get_species(self, default=None):
         '''Return the list of specified and detected species, or else default or else fail if None.'''
-        ret = self._blackboard.get_species(default)
+        ret = self._cached('species', lambda: self._blackboard.get_species())
+        if ret is None:
+            ret = default
         if ret is None:
             raise UserException("no species was specified or determined")
         return ret
 
     def get_closest_reference(self, default=None):
         '''Return dict with fields accession and name for the established closest reference.'''
-        ret = self._blackboard.get_closest_reference(default)
+        ret = self._cached('closest_ref', lambda: self._blackboard.get_closest_reference())
+        if ret is None:
+            ret = default
         if ret is None:
             raise UserException("no closest reference was determined")
         return ret
 
     def get_reference_path(self, default=None):
         '''Return path to FASTA with the user provided reference or else the established one, or else default.'''
-        ret = self._blackboard.get_user_reference_path(self._blackboard.get_closest_reference_path(default))
+        ret = self._cached('ref_path', lambda: self._blackboard.get_user_reference_path(
+            self._blackboard.get_closest_reference_path()))
+        if ret is None:
+            ret = default
         if ret is None:
             raise UserException("no reference genome was specified or found")
         return ret
 
     def get_reference_length(self, default=None):
         '''Return length of FASTA with the user provided reference or else the established one, or else default.'''
-        ret = self._blackboard.get_user_reference_length(self._blackboard.get_closest_reference_length(default))
+        ret = self._cached('ref_length', lambda: self._blackboard.get_user_reference_length(
+            self._blackboard.get_closest_reference_length()))
+        if ret is None:
+            ret = default
         if ret is None:
             raise UserException("no reference length available: no reference was specified or found")
         return ret
 
     def get_plasmids(self, default=None):
         '''Return the list of specified and detected plasmids, or else default or else fail if None.'''
-        ret = self._blackboard.get_plasmids(default)
+        ret = self._cached('plasmids', lambda: self._blackboard.get_plasmids())
+        if ret is None:
+            ret = default
         if ret is None:
             raise UserException("no plasmids were specified or determined")
         return ret
@@ -245,9 +336,19 @@ class UnimplementedService():
 
     def execute(self, sid, xid, blackboard, scheduler):
         return UnimplementedService.UnimplementedTask( \
-                'unimplemented', '1.0.0', sid, blackboard, scheduler)
+                'unimplemented', '1.0.0', sid, xid, blackboard, scheduler)
 
     class UnimplementedTask(ServiceExecution):
+
+        def _transition(self, new_state, error = None):
+            '''Bypass the timestamp bookkeeping of the superclass; this task
+               fails on first report and nothing consumes its run times.'''
+            super(ServiceExecution, self)._transition(new_state, error)
+            self.put_run_info(_RI_STATUS, _STATE_VALUES[new_state])
+            if new_state == Task.State.FAILED:
+                self.add_error(self.error)
+            return new_state
+
         def report(self):
             return self.fail("service %s is not implemented", self.sid)
 
@@ -1,10 +1,9 @@
-from setuptools import find_packages, setup
+import re
+from setuptools import setup
 
-VERSION = '3.0.0'  # sensible default, but get from the bap module
+# Get the version from the bap module, handling either quote style
 with open("bap/__init__.py", 'r') as f:
-    for l in f:
-        if l.startswith('__version__'):
-             VERSION = l.split('=')[1].strip().strip('"')
+    VERSION = re.search(r'__version__\s*=\s*["\']([^"\']+)', f.read()).group(1)
 
 NAME = 'bap'
 DESCRIPTION = 'CGE Bacterial Analysis Pipeline'
@@ -28,7 +27,7 @@ setup(
     author_email = EMAIL,
     python_requires = REQUIRES_PYTHON,
     url = URL,
-    packages = find_packages(exclude=["tests"]),
+    packages = ['bap', 'bap.shims'],
     entry_points={ 'console_scripts': [ 'BAP = bap.BAP:main' ] },
     install_requires = REQUIRED,
     extras_require = EXTRAS,